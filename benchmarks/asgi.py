@@ -0,0 +1,16 @@
+"""
+ASGI entry point for running the application under uvicorn workers.
+
+Each worker imports this module, which installs the local stand-ins
+before the application is loaded:
+    BENCH_STORE_DIR=/tmp/store uvicorn benchmarks.asgi:app --workers 4
+"""
+
+import os
+
+from benchmarks.stand_ins import install_filesystem_s3
+from src.main import app
+
+install_filesystem_s3(os.environ["BENCH_STORE_DIR"])
+
+__all__ = ["app"]
@@ -0,0 +1,86 @@
+"""
+Benchmark for rejecting uploads in the image validation stage.
+
+Each case is measured against files of growing size to show that the
+cost of a rejection only depends on the header, not on the file size.
+Files are created sparse, so large sizes are cheap to set up.
+
+Run from the repository root:
+    python -m benchmarks.bench_image_validation
+"""
+
+import asyncio
+import struct
+import tempfile
+import time
+
+from starlette.datastructures import UploadFile
+
+from src import constants
+from src.images import validation
+
+SIZES = [64 * 1024, 1024**2, 16 * 1024**2, 256 * 1024**2, 1024**3]
+ITERATIONS = 200
+
+
+def png_header(width: int, height: int) -> bytes:
+    """
+    Build a PNG signature and IHDR chunk for the given dimensions.
+    :param width: The width claimed by the header.
+    :param height: The height claimed by the header.
+    :return: The header bytes.
+    """
+    ihdr = struct.pack(">II5B", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + ihdr + b"\0" * 4
+
+
+CASES = {
+    "oversized dimensions": png_header(50_000, 50_000),
+    "unsupported format": b"%PDF-1.7\n" + b"\0" * 32,
+}
+
+
+async def time_rejection(head: bytes, size: int) -> float:
+    """
+    Time the rejection of a sparse file starting with the given header.
+    :param head: The bytes at the start of the file.
+    :param size: The total size of the file.
+    :return: The mean time of a rejection in microseconds.
+    """
+    with tempfile.TemporaryFile() as fp:
+        fp.write(head)
+        fp.truncate(size)
+        upload = UploadFile(fp, size=size)
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            try:
+                await validation.validate_image_upload(upload)
+            except validation.ImageValidationError:
+                pass
+            else:
+                raise AssertionError("upload was not rejected")
+        return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+async def main():
+    """
+    Run every case against every file size and print the results.
+    """
+    print(f"{'case':<24}{'file size':>14}{'us/rejection':>16}")
+    # Lift the byte limit so the header checks are what rejects the upload
+    byte_limit = constants.MAX_UPLOAD_BYTES
+    constants.MAX_UPLOAD_BYTES = max(SIZES)
+    for name, head in CASES.items():
+        for size in SIZES:
+            elapsed = await time_rejection(head, size)
+            print(f"{name:<24}{size:>14}{elapsed:>16.1f}")
+
+    constants.MAX_UPLOAD_BYTES = byte_limit
+    for size in SIZES:
+        if size > byte_limit:
+            elapsed = await time_rejection(png_header(640, 480), size)
+            print(f"{'over byte limit':<24}{size:>14}{elapsed:>16.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
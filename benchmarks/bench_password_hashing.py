@@ -0,0 +1,143 @@
+# pylint: disable=C0415
+
+"""
+Benchmark for password hashing during signup bursts.
+
+A burst of signups runs while a probe keeps reading users, first with
+hashing on the worker pool and then with hashing inline on the event
+loop. Signup throughput and the probe latency show how much a burst of
+~100 ms scrypt hashes slows down the other endpoints.
+
+Run from the repository root:
+    python -m benchmarks.bench_password_hashing [--signups N] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+from benchmarks import bench_endpoints
+
+
+def percentiles(latencies: list) -> str:
+    """
+    Format the p50, p95 and p99 of latencies in milliseconds.
+    :param latencies: The latencies in seconds.
+    :return: The formatted percentiles.
+    """
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    p50, p95, p99 = (cuts[i] * 1000 for i in (49, 94, 98))
+    return f"p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms"
+
+
+async def probe(client, user_id: int, done: asyncio.Event) -> list:
+    """
+    Read a user repeatedly until done is set.
+    :param client: The httpx client connected to the application.
+    :param user_id: The ID of the user to read.
+    :param done: The event that stops the probe.
+    :return: The latency of each read in seconds.
+    """
+    latencies = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get(f"/users/{user_id}")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+    return latencies
+
+
+async def signup_burst(client, count: int, concurrency: int):
+    """
+    Create users from several concurrent clients.
+    :param client: The httpx client connected to the application.
+    :param count: The number of users to create.
+    :param concurrency: The number of concurrent clients.
+    :return: The elapsed seconds and the number of rejected signups.
+    """
+    tag = uuid.uuid4().hex[:8]
+    queue = list(range(count))
+    rejected = 0
+
+    async def worker():
+        nonlocal rejected
+        while queue:
+            user = {
+                "id": 0,
+                "name": "bench",
+                "email": f"signup-{tag}-{queue.pop()}@example.com",
+                "gender": "Male",
+                "password": "benchmark",
+            }
+            response = await client.post("/users/", json=user)
+            rejected += response.status_code != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, rejected
+
+
+async def run(args, ctx):
+    """
+    Measure the probe alone, then during bursts with each hashing mode.
+    :param args: The parsed command line arguments.
+    :param ctx: The seeded IDs.
+    """
+    from benchmarks.asgi import app
+    from src.auth.passwords import password_hasher
+
+    user_id = ctx["ids"]["users"][0]
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    pool_workers = password_hasher.workers
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            done = asyncio.Event()
+            task = asyncio.create_task(probe(client, user_id, done))
+            await asyncio.sleep(2)
+            done.set()
+            print(f"{'idle':<24}{'':>22}probe {percentiles(await task)}")
+
+            for mode, workers in (("pool", pool_workers), ("inline", 0)):
+                password_hasher.workers = workers
+                done = asyncio.Event()
+                task = asyncio.create_task(probe(client, user_id, done))
+                elapsed, rejected = await signup_burst(
+                    client, args.signups, args.concurrency
+                )
+                done.set()
+                print(
+                    f"{mode + ' (' + str(workers) + ' workers)':<24}"
+                    f"{args.signups / elapsed:>8.1f} signups/s"
+                    f"  probe {percentiles(await task)}"
+                    f"  rejected={rejected}"
+                )
+
+
+def main():
+    """
+    Seed the data and run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description="Password hashing benchmark")
+    parser.add_argument("--database-url")
+    parser.add_argument("--workdir")
+    parser.add_argument("--signups", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    # Only a few rows are needed to probe against
+    args.users, args.boards_per_user, args.pins_per_board = 10, 1, 1
+    args.image_width, args.image_height = 64, 64
+
+    bench_endpoints.prepare_environment(args)
+    ctx = bench_endpoints.seed(args)
+    bench_endpoints.quiet_request_logs()
+    asyncio.run(run(args, ctx))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark for similar pin queries on the perceptual hash index.
+
+Random hashes stand in for pins, and each query is a copy of an indexed
+hash with a few bits flipped, like a recompressed or resized image.
+Queries are compared against a linear scan over the same hashes.
+
+Real dHashes are skewed, since flat or low-texture images hash close to
+zero, so a second case puts 30% of the pins in a near-zero cluster and
+queries both the cluster and hashes sharing one zero 16-bit substring.
+Crowded buckets are only sampled there, so that case reports how often
+the results match the scan instead of asserting it.
+
+The sync path is timed too: adding new pins one at a time, searching
+while a merge of the pending pins runs in a worker thread, and catching
+up from an empty index in one bulk add.
+
+Run from the repository root:
+    python -m benchmarks.bench_similarity_index [--pins N] [--queries N]
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from src.images.similarity import SimilarityIndex, hamming
+
+MAX_DISTANCE = 10
+NUMBER = 10
+FLAT_SHARE = 0.3
+
+
+def percentiles(timings: list) -> str:
+    """
+    Format the p50, p95 and p99 of timings in milliseconds.
+    :param timings: The timings in seconds.
+    :return: The formatted percentiles.
+    """
+    p50, p95, p99 = np.percentile(np.array(timings) * 1000, [50, 95, 99])
+    return f"p50={p50:.3f}ms p95={p95:.3f}ms p99={p99:.3f}ms"
+
+
+def flip_bits(rng, value: int, max_bits: int) -> int:
+    """
+    Flip up to max_bits random bits of a hash.
+    :param rng: The random number generator.
+    :param value: The hash.
+    :param max_bits: The largest number of bits to flip.
+    :return: The changed hash.
+    """
+    for bit in rng.choice(64, size=rng.integers(0, max_bits + 1), replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def make_queries(rng, hashes: np.ndarray, count: int) -> list:
+    """
+    Pick indexed hashes and flip up to six bits of each.
+    :param rng: The random number generator.
+    :param hashes: The indexed hashes.
+    :param count: The number of queries.
+    :return: The query hashes.
+    """
+    return [
+        flip_bits(rng, int(hashes[position]), 6)
+        for position in rng.integers(0, len(hashes), size=count)
+    ]
+
+
+def skewed_hashes(rng, count: int) -> np.ndarray:
+    """
+    Generate random hashes with a share of them clustered near zero.
+    :param rng: The random number generator.
+    :param count: The number of hashes.
+    :return: The hashes.
+    """
+    hashes = rng.integers(0, 2**64, size=count, dtype=np.uint64)
+    flat = int(count * FLAT_SHARE)
+    hashes[:flat] = [flip_bits(rng, 0, 3) for _ in range(flat)]
+    rng.shuffle(hashes)
+    return hashes
+
+
+def skewed_queries(rng, hashes: np.ndarray, count: int) -> list:
+    """
+    Query the flat cluster, and indexed hashes with one substring zeroed.
+    :param rng: The random number generator.
+    :param hashes: The indexed hashes.
+    :param count: The number of queries.
+    :return: The query hashes.
+    """
+    queries = [flip_bits(rng, 0, 4) for _ in range(count // 2)]
+    for position in rng.integers(0, len(hashes), size=count - len(queries)):
+        shift = 16 * int(rng.integers(0, 4))
+        query = int(hashes[position]) & ~(0xFFFF << shift) & (2**64 - 1)
+        queries.append(flip_bits(rng, query, 2))
+    return queries
+
+
+def linear_scan(ids: np.ndarray, hashes: np.ndarray, query: int) -> list:
+    """
+    Find the closest hashes by comparing the query with every hash.
+    :param ids: The pin IDs.
+    :param hashes: The hashes of the pins.
+    :param query: The hash to search for.
+    :return: A list of (pin_id, distance) tuples, closest first.
+    """
+    distances = hamming(hashes, np.uint64(query))
+    order = np.lexsort((ids, distances))[:NUMBER]
+    return [
+        (int(ids[i]), int(distances[i])) for i in order if distances[i] <= MAX_DISTANCE
+    ]
+
+
+def bench_updates(rng, index: SimilarityIndex, count: int):
+    """
+    Time adds, searches during a background merge and a bulk catch-up.
+    :param rng: The random number generator.
+    :param index: The index to add pins to.
+    :param count: The number of pins to add one at a time.
+    """
+    first_id = index.max_id + 1
+    hashes = rng.integers(0, 2**64, size=count, dtype=np.uint64)
+    add_timings = []
+    for offset, image_hash in enumerate(hashes):
+        start = time.perf_counter()
+        index.add(first_id + offset, int(image_hash))
+        add_timings.append(time.perf_counter() - start)
+    print(f"add:   {percentiles(add_timings)} ({count} pins)")
+
+    merge = threading.Thread(target=index.merge)
+    start = time.perf_counter()
+    merge.start()
+    search_timings = []
+    while merge.is_alive():
+        query = int(rng.integers(0, 2**64, dtype=np.uint64))
+        search_start = time.perf_counter()
+        index.search(query, number=NUMBER, max_distance=MAX_DISTANCE)
+        search_timings.append(time.perf_counter() - search_start)
+    print(f"merge: {len(index)} pins in {time.perf_counter() - start:.2f}s")
+    print(f"search during merge: {percentiles(search_timings)}")
+
+    # Like a worker starting without an index file
+    empty = SimilarityIndex()
+    start = time.perf_counter()
+    empty.add_many(index.ids, index.hashes)
+    empty.merge()
+    print(f"catch up: {len(empty)} pins in {time.perf_counter() - start:.2f}s")
+
+
+def bench_queries(index, ids, hashes, queries, exact: bool):
+    """
+    Time queries on the index and on a linear scan, and compare them.
+    :param index: The index to query.
+    :param ids: The indexed pin IDs.
+    :param hashes: The indexed hashes.
+    :param queries: The query hashes.
+    :param exact: Whether the index must return the same pins as the scan.
+    """
+    index_timings = []
+    scan_timings = []
+    matching = 0
+    for query in queries:
+        start = time.perf_counter()
+        found = index.search(query, number=NUMBER, max_distance=MAX_DISTANCE)
+        index_timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        expected = linear_scan(ids, hashes, query)
+        scan_timings.append(time.perf_counter() - start)
+        if exact:
+            assert found == expected, (query, found, expected)
+        for pin_id, distance in found:
+            assert distance == int(hamming(hashes[pin_id - 1 : pin_id], query)[0])
+        # Pins at equal distance are interchangeable
+        matching += [d for _, d in found] == [d for _, d in expected]
+
+    print(f"index: {percentiles(index_timings)}")
+    print(f"scan:  {percentiles(scan_timings)}")
+    print(f"same distances as the scan: {matching / len(queries):.1%}")
+
+
+def main():
+    """
+    Build indexes of uniform and skewed hashes and time queries against them.
+    """
+    parser = argparse.ArgumentParser(description="Similarity index benchmark")
+    parser.add_argument("--pins", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--adds", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, args.pins + 1, dtype=np.int64)
+    for name, hashes in (
+        ("uniform", rng.integers(0, 2**64, size=args.pins, dtype=np.uint64)),
+        ("skewed", skewed_hashes(rng, args.pins)),
+    ):
+        start = time.perf_counter()
+        index = SimilarityIndex(ids=ids, hashes=hashes)
+        print(f"{name} build: {args.pins} pins in {time.perf_counter() - start:.2f}s")
+        if name == "uniform":
+            queries = make_queries(rng, hashes, args.queries)
+        else:
+            queries = skewed_queries(rng, hashes, args.queries)
+        bench_queries(index, ids, hashes, queries, exact=name == "uniform")
+
+    bench_updates(rng, index, args.adds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Data generator that seeds users, boards and pins for benchmarks.
+
+Rows are bulk inserted, and every pin points at one of a small set of
+generated images kept in the object store, so large scales stay cheap.
+"""
+
+import io
+import random
+import tempfile
+
+from PIL import Image, ImageDraw
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from src.auth.passwords import password_hasher
+from src.db.models.board import Board as BoardModel
+from src.db.models.pin import Pin as PinModel
+from src.db.models.user import User as UserModel
+from src.db.object_store import upload_to_s3
+from src.enums.gender import Gender
+from src.images.phash import dhash, to_signed
+
+IMAGE_VARIANTS = 16
+SEED_PASSWORD = "benchmark"
+INSERT_BATCH_SIZE = 5000
+LOGIN_SAMPLE_SIZE = 1000
+
+
+def make_image(seed: int, width: int, height: int, image_format: str = "PNG"):
+    """
+    Draw a simple image that differs between seeds.
+    :param seed: The seed of the drawing.
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :param image_format: The Pillow format to encode the image with.
+    :return: The encoded image as bytes.
+    """
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(8):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(10, max(width, height) // 3)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=colour)
+    buffer = io.BytesIO()
+    img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def _upload_variants(bucket: str):
+    """
+    Store the image variants and their thumbnails in the object store.
+    :param bucket: The name of the bucket.
+    :return: A list of (image_url, thumbnail_url, image_hash) tuples.
+    """
+    variants = []
+    for seed in range(IMAGE_VARIANTS):
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            image_file.write(make_image(seed, 1024, 768))
+            image_file.flush()
+            image_url = upload_to_s3(image_file.name, bucket, f"seed_{seed}.png")
+        with tempfile.NamedTemporaryFile(suffix=".png") as thumbnail_file:
+            thumbnail_file.write(make_image(seed, 300, 225))
+            thumbnail_file.flush()
+            thumbnail_url = upload_to_s3(
+                thumbnail_file.name, bucket, f"thumbnail_seed_{seed}.png"
+            )
+            with Image.open(thumbnail_file.name) as img:
+                image_hash = dhash(img)
+        variants.append((image_url, thumbnail_url, image_hash))
+    return variants
+
+
+def _insert(db: Session, model, rows: list):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(insert(model), rows[start : start + INSERT_BATCH_SIZE])
+    db.commit()
+
+
+def _pin_rows(rng, boards, variants: list, pins_per_board: int):
+    """
+    Build the pin rows for the boards.
+    :param rng: The random number generator.
+    :param boards: The (board_id, owner_id) rows of the boards.
+    :param variants: The uploaded image variants.
+    :param pins_per_board: The number of pins on each board.
+    :return: A list of pin rows.
+    """
+    pins = []
+    for board_id, owner_id in boards:
+        for i in range(pins_per_board):
+            image_url, thumbnail_url, image_hash = rng.choice(variants)
+            # Flip a few bits so pins look like near duplicates of the variants
+            for bit in rng.sample(range(64), rng.randrange(5)):
+                image_hash ^= 1 << bit
+            pins.append(
+                {
+                    "title": f"pin {i}",
+                    "description": "seeded pin",
+                    "image_url": image_url,
+                    "thumbnail_url": thumbnail_url,
+                    "board_id": board_id,
+                    "owner_id": owner_id,
+                    "is_private": 1 if rng.random() < 0.1 else 0,
+                    "image_hash": to_signed(image_hash),
+                }
+            )
+    return pins
+
+
+def seed_database(
+    db: Session, bucket: str, users: int, boards_per_user: int, pins_per_board: int
+):
+    """
+    Seed the database unless it already holds users.
+    :param db: The database session.
+    :param bucket: The name of the bucket for the seeded images.
+    :param users: The number of users to create.
+    :param boards_per_user: The number of boards for each user.
+    :param pins_per_board: The number of pins on each board.
+    :return: True if the database was seeded, False if it was reused.
+    """
+    if db.query(UserModel.id).first() is not None:
+        return False
+
+    rng = random.Random(0)
+    # Hashing once keeps seeding fast, every seeded user can still log in
+    hashed_password = password_hasher.hash(SEED_PASSWORD)
+    _insert(
+        db,
+        UserModel,
+        [
+            {
+                "name": f"user {i}",
+                "email": f"user{i}@example.com",
+                "gender": rng.choice(list(Gender)),
+                "password": hashed_password,
+            }
+            for i in range(users)
+        ],
+    )
+    user_ids = [row.id for row in db.query(UserModel.id).order_by(UserModel.id)]
+    _insert(
+        db,
+        BoardModel,
+        [
+            {
+                "name": f"board {i}",
+                "description": "seeded board",
+                "owner_id": owner_id,
+                "is_private": 1 if rng.random() < 0.1 else 0,
+            }
+            for owner_id in user_ids
+            for i in range(boards_per_user)
+        ],
+    )
+    boards = db.query(BoardModel.id, BoardModel.owner_id).order_by(BoardModel.id)
+    pins = _pin_rows(rng, boards, _upload_variants(bucket), pins_per_board)
+    _insert(db, PinModel, pins)
+    return True
+
+
+def id_ranges(db: Session):
+    """
+    Get the lowest and highest IDs of the seeded rows.
+    :param db: The database session.
+    :return: A dict of (min_id, max_id) tuples for users, boards and pins.
+    """
+    return {
+        name: tuple(db.query(func.min(model.id), func.max(model.id)).one())
+        for name, model in (
+            ("users", UserModel),
+            ("boards", BoardModel),
+            ("pins", PinModel),
+        )
+    }
+
+
+def login_emails(db: Session, limit: int = LOGIN_SAMPLE_SIZE) -> list:
+    """
+    Get the emails of seeded users that can log in with SEED_PASSWORD.
+
+    A reused database may hold users seeded with another password or at
+    another scale, so the hashes are checked instead of assumed. Seeded
+    users share a few hashes, and each distinct hash is verified once.
+    :param db: The database session.
+    :param limit: The largest number of users to check.
+    :return: The emails of the users.
+    """
+    rows = (
+        db.query(UserModel.email, UserModel.password)
+        .filter(UserModel.email.like("user%@example.com"))
+        .order_by(UserModel.id)
+        .limit(limit)
+        .all()
+    )
+    verified = {}
+    emails = []
+    for email, hashed_password in rows:
+        if hashed_password not in verified:
+            verified[hashed_password] = password_hasher.verify(
+                SEED_PASSWORD, hashed_password
+            )
+        if verified[hashed_password]:
+            emails.append(email)
+    return emails
@@ -0,0 +1,72 @@
+"""
+Local stand-ins for the services the application talks to.
+
+The S3 client used by src.db.object_store is replaced with one that keeps
+objects in a local directory, so benchmarks run offline and the storage
+cost does not depend on the network.
+"""
+
+import os
+import shutil
+
+from src.db import object_store
+
+
+class FilesystemS3:
+    """
+    Represents an S3 client that stores objects in a local directory.
+
+    Only the calls made by src.db.object_store are implemented.
+
+    Attributes:
+        root (str): The directory holding one subdirectory per bucket.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def upload_file(self, file_path: str, bucket: str, key: str):
+        """
+        Copy a local file into the bucket.
+        :param file_path: The path of the file to upload.
+        :param bucket: The name of the bucket.
+        :param key: The key of the object.
+        """
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(file_path, path)
+
+    def download_file(self, bucket: str, key: str, file_path: str):
+        """
+        Copy an object from the bucket to a local file.
+        :param bucket: The name of the bucket.
+        :param key: The key of the object.
+        :param file_path: The path to write the object to.
+        """
+        shutil.copyfile(self._path(bucket, key), file_path)
+
+    def generate_presigned_url(self, _operation: str, Params: dict, ExpiresIn: int):
+        """
+        Get a file URL for an object, ignoring the expiration.
+        :param _operation: The S3 operation, always get_object.
+        :param Params: The bucket and key of the object.
+        :param ExpiresIn: The validity of the URL in seconds.
+        :return: The URL of the object.
+        """
+        # pylint: disable=C0103,W0613
+        return "file://" + self._path(Params["Bucket"], Params["Key"])
+
+
+def install_filesystem_s3(root: str) -> FilesystemS3:
+    """
+    Replace the S3 client of the object store with a filesystem stand-in.
+    :param root: The directory to keep the objects in.
+    :return: The installed stand-in.
+    """
+    client = FilesystemS3(root)
+    object_store.s3 = client
+    object_store.cache.clear()
+    return client
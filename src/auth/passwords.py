@@ -0,0 +1,213 @@
+"""
+This module hashes and verifies user passwords.
+
+Passwords are hashed with scrypt. Each hash costs around 100 ms of CPU,
+so the async helpers run it on a small dedicated thread pool (scrypt
+releases the GIL) and refuse new work once too many hashes are in flight,
+instead of stalling the event loop or the request threadpool.
+
+Hashes are stored as "scrypt$n$r$p$salt$hash" with base64 salt and hash,
+so hashes made with older cost parameters can be found and upgraded.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src import constants
+
+ALGORITHM = "scrypt"
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Hashes created before scrypt was introduced
+LEGACY_SUFFIX = "notreallyhashed"
+
+
+class PasswordHasherBusy(RuntimeError):
+    """
+    Raised when too many password hashes are running or queued.
+    """
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4), validate=True)
+
+
+def _parse(encoded: str):
+    """
+    Split an encoded scrypt hash into its parts.
+    :param encoded: The encoded hash.
+    :return: The n, r, p, salt and hash, or None if it is not a scrypt hash.
+    """
+    parts = encoded.split("$")
+    if len(parts) != 6 or parts[0] != ALGORITHM:
+        return None
+    try:
+        n, r, p = (int(part) for part in parts[1:4])
+        salt = _b64decode(parts[4])
+        digest = _b64decode(parts[5])
+    except (ValueError, binascii.Error):
+        return None
+    if min(n, r, p) < 1 or not salt or len(digest) != HASH_BYTES:
+        return None
+    return n, r, p, salt, digest
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # scrypt needs 128 * r * n bytes, leave room above OpenSSL's 32 MiB default
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=maxmem,
+        dklen=HASH_BYTES,
+    )
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a bounded pool of worker threads.
+
+    Attributes:
+        n (int): The scrypt CPU and memory cost.
+        r (int): The scrypt block size.
+        p (int): The scrypt parallelization.
+        workers (int): The number of hashing threads, 0 hashes inline.
+        max_pending (int): The number of hashes allowed to run or wait.
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, n: int, r: int, p: int, workers: int, max_pending: int):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+
+    @property
+    def dummy_hash(self) -> str:
+        """
+        Get a hash that no password matches, with the current cost parameters.
+
+        Verifying against it takes as long as a real check, so a login for
+        an unknown email cannot be told apart by its timing.
+        :return: The encoded hash.
+        """
+        salt = _b64encode(bytes(SALT_BYTES))
+        digest = _b64encode(bytes(HASH_BYTES))
+        return f"{ALGORITHM}${self.n}${self.r}${self.p}${salt}${digest}"
+
+    def hash(self, password: str) -> str:
+        """
+        Hash a password with the current cost parameters.
+        :param password: The password to hash.
+        :return: The encoded hash.
+        """
+        salt = os.urandom(SALT_BYTES)
+        digest = _scrypt(password, salt, self.n, self.r, self.p)
+        return "$".join(
+            [
+                ALGORITHM,
+                str(self.n),
+                str(self.r),
+                str(self.p),
+                _b64encode(salt),
+                _b64encode(digest),
+            ]
+        )
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """
+        Check a password against an encoded hash.
+        :param password: The password to check.
+        :param encoded: The encoded hash.
+        :return: True if the password matches.
+        """
+        parsed = _parse(encoded)
+        if parsed is not None:
+            n, r, p, salt, digest = parsed
+            try:
+                if hmac.compare_digest(_scrypt(password, salt, n, r, p), digest):
+                    return True
+            except ValueError:
+                # Cost parameters OpenSSL refuses, so not a hash made here
+                pass
+        # A legacy password can look like a scrypt hash, so check it as one too
+        return hmac.compare_digest(
+            (password + LEGACY_SUFFIX).encode("utf-8"), encoded.encode("utf-8")
+        )
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """
+        Check whether a hash was made with other cost parameters.
+        :param encoded: The encoded hash.
+        :return: True if the password should be hashed again.
+        """
+        parsed = _parse(encoded)
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    async def _run(self, func, *args):
+        """
+        Run a hashing function on the worker pool.
+        :param func: The function to run.
+        :param args: The arguments of the function.
+        :return: The result of the function.
+        :raises PasswordHasherBusy: If too many hashes are running or queued.
+        """
+        if self.workers == 0:
+            return func(*args)
+        # Only touched from the event loop thread, so no lock is needed
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusy("Too many password hashes in progress")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-hash"
+            )
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash_async(self, password: str) -> str:
+        """
+        Hash a password on the worker pool.
+        :param password: The password to hash.
+        :return: The encoded hash.
+        :raises PasswordHasherBusy: If too many hashes are running or queued.
+        """
+        return await self._run(self.hash, password)
+
+    async def verify_async(self, password: str, encoded: str) -> bool:
+        """
+        Check a password against an encoded hash on the worker pool.
+        :param password: The password to check.
+        :param encoded: The encoded hash.
+        :return: True if the password matches.
+        :raises PasswordHasherBusy: If too many hashes are running or queued.
+        """
+        return await self._run(self.verify, password, encoded)
+
+
+password_hasher = PasswordHasher(
+    n=constants.PASSWORD_SCRYPT_N,
+    r=constants.PASSWORD_SCRYPT_R,
+    p=constants.PASSWORD_SCRYPT_P,
+    workers=constants.PASSWORD_HASH_WORKERS,
+    max_pending=constants.PASSWORD_HASH_MAX_PENDING,
+)
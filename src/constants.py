@@ -13,3 +13,36 @@ S3_BUCKET = os.getenv("S3_BUCKET")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION")
+
+# Upload validation limits, enforced from the image header before decoding
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(40_000_000)))
+# Checked against the supported formats when src.images.validation is imported
+ALLOWED_IMAGE_FORMATS = [
+    name.strip().upper()
+    for name in os.getenv("ALLOWED_IMAGE_FORMATS", "JPEG,PNG,GIF,WEBP").split(",")
+    if name.strip()
+]
+IMAGE_SNIFF_BYTES = int(os.getenv("IMAGE_SNIFF_BYTES", str(8 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Perceptual hash index for similar pins
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH", "phash_index.npz")
+SIMILAR_PINS_MAX_DISTANCE = int(os.getenv("SIMILAR_PINS_MAX_DISTANCE", "10"))
+SIMILAR_PINS_MAX_NUMBER = int(os.getenv("SIMILAR_PINS_MAX_NUMBER", "100"))
+
+# Password hashing with scrypt, run on a bounded pool of worker threads
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2**15)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Request profiling, opt-in with the profile token header or by sampling
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/imagenest-profiles")
+PROFILE_MAX_ENTRIES = int(os.getenv("PROFILE_MAX_ENTRIES", "100"))
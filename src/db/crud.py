@@ -2,7 +2,7 @@
 This Module defines the CRUD operations for the application.
 """
 
-from sqlalchemy import func
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 
 from src.db.models.board import Board as BoardModel
@@ -23,19 +23,19 @@ def get_user_by_email(db: Session, email: str):
     return db.query(UserModel).filter(UserModel.email == email).first()
 
 
-def create_user(db: Session, user: UserCreate):
+def create_user(db: Session, user: UserCreate, hashed_password: str):
     """
     Create a new user in the database.
     :param db: The database session
     :param user: The user to create.
+    :param hashed_password: The hash of the user's password.
     :return: The created user.
     """
-    fake_hashed_password = user.password + "notreallyhashed"
     db_user = UserModel(
         name=user.name,
         email=user.email,
         gender=user.gender,
-        password=fake_hashed_password,
+        password=hashed_password,
     )
     db.add(db_user)
     db.commit()
@@ -43,6 +43,20 @@ def create_user(db: Session, user: UserCreate):
     return db_user
 
 
+def update_user_password(db: Session, db_user: UserModel, hashed_password: str):
+    """
+    Replace the stored password hash of a user.
+    :param db: The database session.
+    :param db_user: The user to update.
+    :param hashed_password: The new hash of the user's password.
+    :return: The updated user.
+    """
+    db_user.password = hashed_password
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
 def get_user(db: Session, user_id: int):
     """
     Get a user by ID.
@@ -107,6 +121,7 @@ def create_pin(db: Session, pin: Pin):
         owner_id=pin.owner_id,
         thumbnail_url=pin.thumbnail_url,
         is_private=1 if pin.is_private else 0,
+        image_hash=pin.image_hash,
     )
     db.add(db_pin)
     db.commit()
@@ -124,6 +139,54 @@ def get_pin(db: Session, pin_id: int):
     return db.query(PinModel).filter(PinModel.id == pin_id).first()
 
 
+def get_pins_by_ids(db: Session, pin_ids: list):
+    """
+    Get pins by ID, in the order of the given IDs.
+    :param db: The database session.
+    :param pin_ids: The IDs of the pins.
+    :return: A list of the pins that exist.
+    """
+    pins = {pin.id: pin for pin in db.query(PinModel).filter(PinModel.id.in_(pin_ids))}
+    return [pins[pin_id] for pin_id in pin_ids if pin_id in pins]
+
+
+def get_public_pin_hashes(db: Session, after_id: int = 0, pin_ids=()):
+    """
+    Get the image hashes of public pins.
+    :param db: The database session.
+    :param after_id: Only return pins with a greater ID.
+    :param pin_ids: Also return the pins with these IDs.
+    :return: A list of (pin_id, image_hash) rows ordered by ID.
+    """
+    return (
+        db.query(PinModel.id, PinModel.image_hash)
+        .filter(
+            PinModel.is_private == 0,
+            PinModel.image_hash.isnot(None),
+            or_(PinModel.id > after_id, PinModel.id.in_(pin_ids)),
+        )
+        .order_by(PinModel.id)
+        .all()
+    )
+
+
+def get_pins_without_hash(db: Session, after_id: int, limit: int):
+    """
+    Get pins whose image hash has not been computed.
+    :param db: The database session.
+    :param after_id: Only return pins with a greater ID.
+    :param limit: The maximum number of pins to return.
+    :return: A list of pins without an image hash.
+    """
+    return (
+        db.query(PinModel)
+        .filter(PinModel.image_hash.is_(None), PinModel.id > after_id)
+        .order_by(PinModel.id)
+        .limit(limit)
+        .all()
+    )
+
+
 def get_random_public_pins(db: Session, number: int):
     """
     Get random
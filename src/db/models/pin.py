@@ -7,7 +7,7 @@ The Pin model represents a pin in the application.
 It includes attributes for the pin's id, title, and image_url.
 """
 
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String
 from sqlalchemy.orm import relationship
 
 from .base import Base
@@ -24,6 +24,7 @@ class Pin(Base):
         image_url (str): The URL of the pin's image.
         board_id (int): The identifier of the board the pin belongs to.
         owner_id (int): The identifier of the user who owns the pin.
+        image_hash (int): The perceptual hash of the pin's image, stored signed.
     """
 
     __tablename__ = "pins"
@@ -36,6 +37,7 @@ class Pin(Base):
     board_id = Column(Integer, ForeignKey("boards.id"))
     owner_id = Column(Integer, ForeignKey("users.id"))
     is_private = Column(Integer)
+    image_hash = Column(BigInteger)
 
     user = relationship("User", back_populates="pins")
     board = relationship("Board", back_populates="pins")
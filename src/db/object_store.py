@@ -9,6 +9,7 @@ import cachetools
 from botocore.exceptions import NoCredentialsError
 
 from src.constants import AWS_ACCESS_KEY_ID, AWS_REGION, AWS_SECRET_ACCESS_KEY
+from src.profiling.context import timed
 
 logging.basicConfig(level=logging.INFO)
 
@@ -23,6 +24,7 @@ s3 = boto3.client(
 cache = cachetools.TTLCache(maxsize=1000, ttl=180)
 
 
+@timed
 @cachetools.cached(cache, key=lambda bucket, object_name: object_name)
 def generate_presigned_url(bucket, s3_file_name, expiration=300):
     """
@@ -45,6 +47,7 @@ def generate_presigned_url(bucket, s3_file_name, expiration=300):
     return response
 
 
+@timed
 def upload_to_s3(file_path, bucket, s3_file_name):
     """
     Upload a file to an S3 bucket.
@@ -12,8 +12,10 @@ from src.db.models.base import Base
 from src.db.models.board import Board  # Ensure Board model is imported
 from src.db.models.pin import Pin  # Ensure Pin model is imported
 from src.db.models.user import User  # Ensure User model is imported
+from src.profiling.context import install_sql_hooks
 
 engine = create_engine(DATABASE_URL)
+install_sql_hooks(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.create_all(bind=engine)
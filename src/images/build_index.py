@@ -0,0 +1,95 @@
+"""
+Command line tool to build the similarity index of pins.
+
+Run from the project root:
+    python -m src.images.build_index [--backfill] [--output PATH]
+
+With --backfill, pins created before perceptual hashes were stored are
+hashed first from their thumbnails in S3.
+"""
+
+import argparse
+import logging
+import os
+
+from PIL import Image
+
+from src import constants
+from src.db import crud
+from src.db.object_store import download_from_s3
+from src.db.session import SessionLocal
+from src.images.phash import dhash, to_signed, to_unsigned
+from src.images.similarity import SimilarityIndex
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_hashes(db):
+    """
+    Compute the image hash of every pin that does not have one.
+    :param db: The database session.
+    :return: The number of pins hashed.
+    """
+    hashed = 0
+    after_id = 0
+    while pins := crud.get_pins_without_hash(
+        db, after_id=after_id, limit=BACKFILL_BATCH_SIZE
+    ):
+        for pin in pins:
+            thumbnail_filename = pin.thumbnail_url.split("/")[-1]
+            local_file_path = f"/tmp/{thumbnail_filename}"
+            download_from_s3(constants.S3_BUCKET, thumbnail_filename, local_file_path)
+            if not os.path.exists(local_file_path):
+                continue
+            with Image.open(local_file_path) as img:
+                pin.image_hash = to_signed(dhash(img))
+            os.remove(local_file_path)
+            hashed += 1
+        db.commit()
+        after_id = pins[-1].id
+    return hashed
+
+
+def build_index(db):
+    """
+    Build the similarity index from the hashes of all public pins.
+    :param db: The database session.
+    :return: The built index.
+    """
+    rows = crud.get_public_pin_hashes(db)
+    return SimilarityIndex(
+        ids=[pin_id for pin_id, _ in rows],
+        hashes=[to_unsigned(image_hash) for _, image_hash in rows],
+    )
+
+
+def main():
+    """
+    Parse the arguments, then build and save the index.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="hash pins that were created without an image hash",
+    )
+    parser.add_argument(
+        "--output",
+        default=constants.PHASH_INDEX_PATH,
+        help="path of the index file",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.backfill:
+            logging.info("Hashed %d pins", backfill_hashes(db))
+        index = build_index(db)
+    finally:
+        db.close()
+    index.save(args.output)
+    logging.info("Saved index of %d pins to %s", len(index), args.output)
+
+
+if __name__ == "__main__":
+    main()
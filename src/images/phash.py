@@ -0,0 +1,51 @@
+"""
+This module computes perceptual hashes of images.
+
+The difference hash (dHash) compares the brightness of neighbouring
+pixels on a tiny grayscale copy of the image, so resized or recompressed
+copies of the same picture end up within a small Hamming distance.
+"""
+
+from PIL.Image import Resampling
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+_SIGN_BIT = 1 << (HASH_BITS - 1)
+_MODULUS = 1 << HASH_BITS
+
+
+def dhash(img) -> int:
+    """
+    Compute the 64-bit difference hash of an image.
+    :param img: The Pillow image to hash.
+    :return: The hash as an unsigned integer.
+    """
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            left = pixels[offset + col]
+            right = pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def to_signed(value: int) -> int:
+    """
+    Convert an unsigned hash to a signed integer for a BIGINT column.
+    :param value: The unsigned hash.
+    :return: The same 64 bits as a signed integer.
+    """
+    return value - _MODULUS if value & _SIGN_BIT else value
+
+
+def to_unsigned(value: int) -> int:
+    """
+    Convert a hash read from a BIGINT column back to an unsigned integer.
+    :param value: The signed hash.
+    :return: The same 64 bits as an unsigned integer.
+    """
+    return value % _MODULUS
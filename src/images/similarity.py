@@ -0,0 +1,331 @@
+"""
+This module defines the similarity index for perceptual hashes.
+
+The index uses multi-index hashing: each 64-bit hash is split into
+four 16-bit substrings, and each substring is kept in its own sorted
+table. Two hashes within Hamming distance r share at least one substring
+within distance r // 4, so a query only probes a few hundred keys per
+table and verifies the candidates, instead of scanning every pin.
+
+Real hashes are skewed: flat or low-texture images hash close to zero,
+so a few substrings are shared by a large share of the pins. Only an
+evenly spread sample of such crowded buckets is verified, which keeps
+queries fast at the cost of exactness inside the crowd, where the pins
+look alike anyway.
+"""
+
+import os
+import threading
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+from src.db import crud
+from src.images.phash import HASH_BITS, to_unsigned
+
+TABLES = 4
+SUBSTRING_BITS = HASH_BITS // TABLES
+
+# Pins added after the last build are scanned linearly until they are merged
+PENDING_MERGE_MIN = 1024
+PENDING_MERGE_RATIO = 0.01
+
+# IDs this far below the highest synced ID are checked again on each sync,
+# since inserts can commit in a different order than their IDs were issued
+SYNC_WINDOW = 1000
+
+# Buckets larger than this are crowded, and all the crowded buckets of a
+# table probe share one sample of this size instead of being verified
+MAX_BUCKET_CANDIDATES = 2048
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_SUBSTRING_MASK = np.uint64((1 << SUBSTRING_BITS) - 1)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> np.ndarray:
+    """
+    Get every substring mask with exactly radius bits set.
+    :param radius: The number of bits to flip.
+    :return: The masks as an array.
+    """
+    masks = [
+        sum(1 << bit for bit in bits)
+        for bits in combinations(range(SUBSTRING_BITS), radius)
+    ]
+    return np.array(masks, dtype=np.uint64)
+
+
+def hamming(hashes: np.ndarray, query: np.uint64) -> np.ndarray:
+    """
+    Get the Hamming distance between each hash and the query.
+    :param hashes: The hashes as an uint64 array.
+    :param query: The hash to compare against.
+    :return: The distances as an array.
+    """
+    diff = np.bitwise_xor(hashes, query)
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def _build_tables(hashes: np.ndarray):
+    """
+    Sort the substrings of the hashes into one table per substring.
+    :param hashes: The unsigned hashes.
+    :return: The sorted keys and the hash position of each key, per table.
+    """
+    keys_tables = []
+    order_tables = []
+    for table in range(TABLES):
+        keys = (hashes >> np.uint64(table * SUBSTRING_BITS)) & _SUBSTRING_MASK
+        order = np.argsort(keys, kind="stable")
+        keys_tables.append(keys[order])
+        order_tables.append(order)
+    return keys_tables, order_tables
+
+
+def _bucket_positions(order: np.ndarray, lows: np.ndarray, highs: np.ndarray):
+    """
+    Get the positions in the probed buckets of one table.
+
+    Small buckets are returned in full. The crowded ones share a sample
+    of MAX_BUCKET_CANDIDATES positions, spread evenly over each bucket.
+    :param order: The hash position of each key in the table.
+    :param lows: The start of each probed bucket.
+    :param highs: The end of each probed bucket.
+    :return: A list of position arrays.
+    """
+    sizes = highs - lows
+    crowded = int(sizes[sizes > MAX_BUCKET_CANDIDATES].sum())
+    step = -(-crowded // MAX_BUCKET_CANDIDATES)
+    return [
+        order[low:high:step] if high - low > MAX_BUCKET_CANDIDATES else order[low:high]
+        for low, high in zip(lows, highs)
+        if high > low
+    ]
+
+
+def _probe(keys_tables: list, order_tables: list, query: np.uint64, radius: int):
+    """
+    Get the positions of the hashes sharing a substring at exactly radius.
+    :param keys_tables: The sorted keys of each table.
+    :param order_tables: The hash position of each key, per table.
+    :param query: The hash to search for.
+    :param radius: The Hamming distance between the substrings.
+    :return: The positions in the sorted tables.
+    """
+    masks = _flip_masks(radius)
+    positions = []
+    for table in range(TABLES):
+        key = (query >> np.uint64(table * SUBSTRING_BITS)) & _SUBSTRING_MASK
+        probes = np.bitwise_xor(masks, key)
+        keys = keys_tables[table]
+        lows = np.searchsorted(keys, probes, side="left")
+        highs = np.searchsorted(keys, probes, side="right")
+        positions.extend(_bucket_positions(order_tables[table], lows, highs))
+    if not positions:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(positions))
+
+
+class SimilarityIndex:  # pylint: disable=R0902
+    """
+    Represents a nearest-neighbour index of pin hashes.
+
+    Pins added after the last build wait in a pending buffer that is
+    scanned linearly. merge folds them into the sorted tables on a copy
+    and swaps it in, so it can run in a worker thread while requests
+    keep searching.
+
+    Attributes:
+        ids (np.ndarray): The pin IDs in the sorted tables.
+        hashes (np.ndarray): The unsigned hashes of the pins in the sorted tables.
+        max_id (int): The highest pin ID added to the index.
+    """
+
+    def __init__(self, ids=None, hashes=None):
+        self.ids = np.asarray([] if ids is None else ids, dtype=np.int64)
+        self.hashes = np.asarray([] if hashes is None else hashes, dtype=np.uint64)
+        self._keys, self._order = _build_tables(self.hashes)
+        self._pending_ids = []
+        self._pending_hashes = []
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self.max_id = 0
+        self._missing = set()
+        self._track_ids(self.ids)
+
+    def __len__(self):
+        return len(self.ids) + len(self._pending_ids)
+
+    def _track_ids(self, ids: np.ndarray):
+        """
+        Advance max_id over new pin IDs and remember the IDs skipped below it.
+        :param ids: The pin IDs above max_id that were just added.
+        """
+        if ids.size == 0:
+            return
+        new_max = max(self.max_id, int(ids.max()))
+        low = max(self.max_id, new_max - SYNC_WINDOW)
+        self._missing.update(range(low + 1, new_max + 1))
+        self._missing.difference_update(ids[ids > low].tolist())
+        self.max_id = new_max
+        self._missing = {
+            pin_id for pin_id in self._missing if pin_id > new_max - SYNC_WINDOW
+        }
+
+    @property
+    def missing_ids(self) -> list:
+        """
+        Get the IDs just below max_id that are not in the index.
+
+        They belong to private pins, deleted pins, or pins whose insert had
+        not committed yet when a later one was synced.
+        :return: The missing IDs.
+        """
+        with self._lock:
+            return sorted(self._missing)
+
+    def add_many(self, ids, hashes):
+        """
+        Add pins to the index, skipping the ones already in it.
+        :param ids: The IDs of the pins.
+        :param hashes: The unsigned perceptual hashes of the pins' images.
+        :return: The number of pins added.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        with self._lock:
+            is_new = ids > self.max_id
+            keep = is_new | np.isin(ids, list(self._missing))
+            self._missing.difference_update(ids[keep].tolist())
+            self._track_ids(ids[is_new])
+            self._pending_ids.extend(ids[keep].tolist())
+            self._pending_hashes.extend(hashes[keep].tolist())
+        return int(np.count_nonzero(keep))
+
+    def add(self, pin_id: int, image_hash: int):
+        """
+        Add a pin to the index.
+        :param pin_id: The ID of the pin.
+        :param image_hash: The unsigned perceptual hash of the pin's image.
+        """
+        self.add_many([pin_id], [image_hash])
+
+    def merge_due(self) -> bool:
+        """
+        Check whether the pending buffer has grown enough to be merged.
+        :return: True if merge should be called.
+        """
+        limit = max(PENDING_MERGE_MIN, int(len(self.ids) * PENDING_MERGE_RATIO))
+        return len(self._pending_ids) >= limit and not self._merge_lock.locked()
+
+    def merge(self) -> bool:
+        """
+        Fold the pending pins into the sorted tables.
+
+        The tables are rebuilt outside the lock, so searches are only
+        held up while the new tables are swapped in. Pins added during
+        the rebuild stay pending.
+        :return: False if another merge was already running.
+        """
+        # Released below, once the new tables are swapped in
+        if not self._merge_lock.acquire(blocking=False):  # pylint: disable=R1732
+            return False
+        try:
+            with self._lock:
+                count = len(self._pending_ids)
+                ids = np.concatenate(
+                    [self.ids, np.array(self._pending_ids, dtype=np.int64)]
+                )
+                hashes = np.concatenate(
+                    [self.hashes, np.array(self._pending_hashes, dtype=np.uint64)]
+                )
+            keys, order = _build_tables(hashes)
+            with self._lock:
+                self.ids, self.hashes = ids, hashes
+                self._keys, self._order = keys, order
+                del self._pending_ids[:count]
+                del self._pending_hashes[:count]
+        finally:
+            self._merge_lock.release()
+        return True
+
+    def search(self, image_hash: int, number: int, max_distance: int, exclude=None):
+        """
+        Find the pins with the closest hashes.
+        :param image_hash: The unsigned hash to search for.
+        :param number: The number of pins to return.
+        :param max_distance: The largest Hamming distance to return.
+        :param exclude: A pin ID to leave out of the results.
+        :return: A list of (pin_id, distance) tuples, closest first.
+        """
+        # pylint: disable=R0914
+        with self._lock:
+            ids, hashes = self.ids, self.hashes
+            keys_tables, order_tables = self._keys, self._order
+            pending_ids = np.array(self._pending_ids, dtype=np.int64)
+            pending_hashes = np.array(self._pending_hashes, dtype=np.uint64)
+
+        query = np.uint64(image_hash)
+        candidates = [pending_ids]
+        distances = [hamming(pending_hashes, query)]
+
+        for radius in range(min(max_distance, HASH_BITS) // TABLES + 1):
+            positions = _probe(keys_tables, order_tables, query, radius)
+            candidates.append(ids[positions])
+            distances.append(hamming(hashes[positions], query))
+
+            # The same pin is found once per matching table, keep one copy
+            found_ids, first = np.unique(np.concatenate(candidates), return_index=True)
+            found = np.concatenate(distances)[first]
+            keep = (found <= max_distance) & (found_ids != exclude)
+            found_ids, found = found_ids[keep], found[keep]
+
+            # Every hash within this distance shares a substring probed so far
+            if np.count_nonzero(found <= TABLES * (radius + 1) - 1) >= number:
+                break
+
+        order = np.lexsort((found_ids, found))[:number]
+        return [(int(found_ids[i]), int(found[i])) for i in order]
+
+    def save(self, path: str):
+        """
+        Save the index to a file, replacing it atomically.
+        :param path: The path of the file.
+        """
+        if self._pending_ids:
+            self.merge()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as fp:
+            np.savez(fp, ids=self.ids, hashes=self.hashes)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load an index saved with save.
+        :param path: The path of the file.
+        :return: The loaded index.
+        """
+        with np.load(path) as data:
+            return cls(ids=data["ids"], hashes=data["hashes"])
+
+
+def sync_index(index: SimilarityIndex, db):
+    """
+    Add the public pins created since the index was last synced.
+
+    Pins with IDs the index skipped just below its highest ID are fetched
+    again, in case their insert committed after a later one.
+    :param index: The index to update.
+    :param db: The database session.
+    :return: The number of pins added.
+    """
+    rows = crud.get_public_pin_hashes(
+        db, after_id=index.max_id, pin_ids=index.missing_ids
+    )
+    if not rows:
+        return 0
+    pin_ids, image_hashes = zip(*rows)
+    return index.add_many(pin_ids, [to_unsigned(value) for value in image_hashes])
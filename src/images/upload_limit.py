@@ -0,0 +1,46 @@
+"""
+This module rejects oversized pin uploads before their body is read.
+
+It is a plain ASGI middleware rather than an http middleware, so requests
+to the other routes are passed through without being wrapped.
+"""
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+from src.constants import MAX_UPLOAD_BYTES
+
+UPLOAD_PATH = "/pins/create/"
+
+# Room for the form fields and multipart boundaries around the image
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class LimitUploadSize:  # pylint: disable=R0903
+    """
+    Rejects pin uploads whose declared body is too large.
+
+    Attributes:
+        app: The wrapped ASGI application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == UPLOAD_PATH:
+            content_length = Headers(scope=scope).get("content-length")
+            if (
+                content_length is not None
+                and content_length.isdigit()
+                and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+            ):
+                response = JSONResponse(
+                    status_code=413,
+                    content={
+                        "detail": f"File exceeds the {MAX_UPLOAD_BYTES} byte limit"
+                    },
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
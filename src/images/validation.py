@@ -0,0 +1,274 @@
+"""
+This module validates uploaded images before they are decoded.
+
+The format is sniffed from the magic bytes and the dimensions are read
+from the image header, so oversized or malformed uploads are rejected
+after reading only the first few KB of the stream.
+"""
+
+import struct
+from dataclasses import dataclass
+
+import aiofiles
+
+from src import constants
+
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+# JPEG start-of-frame markers carry the frame dimensions.
+# 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) share the range but are not frames.
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_STANDALONE_MARKERS = frozenset({0x01, *range(0xD0, 0xD9)})
+_JPEG_MAX_SEGMENTS = 256
+
+_GIF_IMAGE_DESCRIPTOR = 0x2C
+_GIF_EXTENSION = 0x21
+_GIF_MAX_BLOCKS = 1024
+
+
+def _check_allowed_formats():
+    """
+    Fail at startup when ALLOWED_IMAGE_FORMATS names an unsupported format.
+    :raises ValueError: If no format or a format without a validator is set.
+    """
+    if not constants.ALLOWED_IMAGE_FORMATS:
+        raise ValueError("ALLOWED_IMAGE_FORMATS is empty")
+    unknown = set(constants.ALLOWED_IMAGE_FORMATS) - EXTENSIONS.keys()
+    if unknown:
+        raise ValueError(
+            f"Unsupported ALLOWED_IMAGE_FORMATS {sorted(unknown)}, "
+            f"expected some of {sorted(EXTENSIONS)}"
+        )
+
+
+_check_allowed_formats()
+
+
+class ImageValidationError(ValueError):
+    """
+    Raised when an uploaded image is rejected.
+
+    Attributes:
+        status_code (int): The HTTP status code to report to the client.
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """
+    Represents the header information of an uploaded image.
+
+    Attributes:
+        format (str): The Pillow format name of the image.
+        width (int): The width of the image in pixels.
+        height (int): The height of the image in pixels.
+    """
+
+    format: str
+    width: int
+    height: int
+
+    @property
+    def extension(self) -> str:
+        """
+        Get the file extension for the image format.
+        :return: The file extension without the leading dot.
+        """
+        return EXTENSIONS[self.format]
+
+
+def sniff_format(head: bytes):
+    """
+    Detect the image format from its magic bytes.
+    :param head: The first bytes of the file.
+    :return: The Pillow format name, or None if the format is unknown.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _png_dimensions(head: bytes):
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def _webp_dimensions(head: bytes):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30 and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25 and head[20] == 0x2F:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
+
+
+async def _read_at(file, head: bytes, offset: int, size: int) -> bytes:
+    """
+    Read bytes at an offset, serving them from the header when possible.
+    :param file: The uploaded file.
+    :param head: The bytes already read from the start of the file.
+    :param offset: The offset to read from.
+    :param size: The number of bytes to read.
+    :return: The bytes read, which may be shorter than size at EOF.
+    """
+    if offset + size <= len(head):
+        return head[offset : offset + size]
+    await file.seek(offset)
+    return await file.read(size)
+
+
+async def _jpeg_dimensions(file, head: bytes):
+    """
+    Walk the JPEG segment headers until the start-of-frame marker.
+
+    Only the segment headers are read, so large EXIF or ICC segments
+    are skipped with a seek instead of being buffered.
+    """
+    offset = 2
+    for _ in range(_JPEG_MAX_SEGMENTS):
+        segment = await _read_at(file, head, offset, 4)
+        if len(segment) < 2 or segment[0] != 0xFF:
+            return None
+        marker = segment[1]
+        if marker == 0xFF:
+            # Fill byte before the marker
+            offset += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if len(segment) < 4 or marker in (0xD9, 0xDA):
+            # End of image or scan data before any frame header
+            return None
+        if marker in _JPEG_SOF_MARKERS:
+            frame = await _read_at(file, head, offset + 5, 4)
+            if len(frame) < 4:
+                return None
+            height, width = struct.unpack(">HH", frame)
+            return width, height
+        (length,) = struct.unpack(">H", segment[2:4])
+        if length < 2:
+            return None
+        offset += 2 + length
+    return None
+
+
+async def _gif_dimensions(file, head: bytes):
+    """
+    Walk the GIF blocks until the first image descriptor.
+
+    Pillow grows the canvas to fit a frame that is larger than the
+    logical screen, so the size is taken from both. Only the first frame
+    is decoded when a pin is created, so later frames are not checked.
+    """
+    if len(head) < 13:
+        return None
+    screen_width, screen_height, flags = struct.unpack("<HHB", head[6:11])
+    offset = 13
+    if flags & 0x80:
+        offset += 3 << ((flags & 0x07) + 1)
+    in_extension = False
+    for _ in range(_GIF_MAX_BLOCKS):
+        if in_extension:
+            # Skip the data sub-blocks up to the empty terminator
+            size = await _read_at(file, head, offset, 1)
+            if not size:
+                return None
+            offset += 1 + size[0]
+            in_extension = size[0] != 0
+            continue
+        block = await _read_at(file, head, offset, 2)
+        if block[:1] == bytes([_GIF_IMAGE_DESCRIPTOR]):
+            descriptor = await _read_at(file, head, offset + 1, 8)
+            if len(descriptor) < 8:
+                return None
+            left, top, width, height = struct.unpack("<HHHH", descriptor)
+            return max(screen_width, left + width), max(screen_height, top + height)
+        if block[:1] != bytes([_GIF_EXTENSION]) or len(block) < 2:
+            # Trailer, garbage or end of file before any frame
+            return None
+        # Skip the introducer and the extension label
+        offset += 2
+        in_extension = True
+    return None
+
+
+async def validate_image_upload(file) -> ImageInfo:
+    """
+    Validate an uploaded image using only its size and header.
+    :param file: The uploaded file.
+    :return: The format and dimensions of the image.
+    :raises ImageValidationError: If the upload breaks a configured limit.
+    """
+    if file.size is not None and file.size > constants.MAX_UPLOAD_BYTES:
+        raise ImageValidationError(
+            f"File exceeds the {constants.MAX_UPLOAD_BYTES} byte limit", status_code=413
+        )
+
+    await file.seek(0)
+    head = await file.read(constants.IMAGE_SNIFF_BYTES)
+    image_format = sniff_format(head)
+    if image_format is None or image_format not in constants.ALLOWED_IMAGE_FORMATS:
+        raise ImageValidationError("Unsupported image format", status_code=415)
+
+    if image_format == "JPEG":
+        dimensions = await _jpeg_dimensions(file, head)
+    elif image_format == "PNG":
+        dimensions = _png_dimensions(head)
+    elif image_format == "GIF":
+        dimensions = await _gif_dimensions(file, head)
+    else:
+        dimensions = _webp_dimensions(head)
+
+    if dimensions is None:
+        raise ImageValidationError("Malformed image header")
+    width, height = dimensions
+    if width == 0 or height == 0:
+        raise ImageValidationError("Image has no pixels")
+    if width * height > constants.MAX_IMAGE_PIXELS:
+        raise ImageValidationError(
+            f"Image exceeds the {constants.MAX_IMAGE_PIXELS} pixel limit",
+            status_code=413,
+        )
+
+    await file.seek(0)
+    return ImageInfo(format=image_format, width=width, height=height)
+
+
+async def save_upload(file, path: str):
+    """
+    Stream an uploaded file to disk in chunks, enforcing the byte limit.
+    :param file: The uploaded file.
+    :param path: The local path to write the file to.
+    :return: The number of bytes written.
+    :raises ImageValidationError: If the file exceeds the byte limit.
+    """
+    written = 0
+    await file.seek(0)
+    async with aiofiles.open(path, "wb") as buffer:
+        while chunk := await file.read(constants.UPLOAD_CHUNK_BYTES):
+            written += len(chunk)
+            if written > constants.MAX_UPLOAD_BYTES:
+                raise ImageValidationError(
+                    f"File exceeds the {constants.MAX_UPLOAD_BYTES} byte limit",
+                    status_code=413,
+                )
+            await buffer.write(chunk)
+    return written
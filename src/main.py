@@ -3,26 +3,68 @@
 """
 Application Start Point Where FastAPI is Configured and Endpoints are Defined.
 """
+import asyncio
 import os
 import uuid
+import warnings
+from contextlib import asynccontextmanager
 
-import aiofiles
 from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from PIL import Image, ImageOps
 from PIL.Image import Resampling
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from src.constants import S3_BUCKET
+from src import constants
+from src.auth.passwords import PasswordHasherBusy, password_hasher
+from src.constants import MAX_IMAGE_PIXELS, S3_BUCKET
 from src.db import crud
 from src.db.object_store import generate_presigned_url, upload_to_s3
 from src.db.session import SessionLocal
+from src.images import validation
+from src.images.phash import dhash, to_signed, to_unsigned
+from src.images.similarity import SimilarityIndex, sync_index
+from src.images.upload_limit import LimitUploadSize
 from src.models.board import Board
 from src.models.pin import Pin
 from src.models.user import User
 from src.models.user_create import UserCreate
+from src.models.user_login import UserLogin
+from src.profiling.middleware import ProfileRequests, require_profile_token
+from src.profiling.store import profile_store
 
-app = FastAPI()
+# Backstop for the header checks. Pillow only warns between the limit and
+# twice the limit, so the warning is raised as an error too.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+similarity_index = SimilarityIndex()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Load the similarity index and catch up with pins created since it was built.
+    :param _app: The FastAPI application.
+    """
+    global similarity_index  # pylint: disable=W0603
+    if os.path.exists(constants.PHASH_INDEX_PATH):
+        similarity_index = await run_in_threadpool(
+            SimilarityIndex.load, constants.PHASH_INDEX_PATH
+        )
+    db = SessionLocal()
+    try:
+        await run_in_threadpool(sync_index, similarity_index, db)
+    finally:
+        db.close()
+    await run_in_threadpool(similarity_index.merge)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["http://localhost:3000"]
 
@@ -34,6 +76,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(LimitUploadSize)
+
+# Registered last so the profile also covers the other middleware
+app.add_middleware(ProfileRequests)
+
 
 def get_db():
     """
@@ -47,18 +94,92 @@ def get_db():
         db.close()
 
 
+@app.get("/admin/profiles", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    """
+    List the saved request profiles.
+    :return: A summary of each profile, newest first.
+    """
+    return await run_in_threadpool(profile_store.summaries)
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def read_profile(profile_id: str):
+    """
+    Get a saved request profile.
+    :param profile_id: The ID of the profile.
+    :return: The profile with the given ID.
+    """
+    profile = await run_in_threadpool(profile_store.get, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(_request, exc: PasswordHasherBusy):
+    """
+    Ask clients to retry when the password hashing pool is saturated.
+    :param _request: The request that could not be served.
+    :param exc: The raised exception.
+    :return: The error response.
+    """
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
 @app.post("/users/", response_model=User)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
     """
     Create a new user.
     :param user: The user to create.
     :param db: The database session.
     :return: The created user.
     """
-    db_user = crud.get_user_by_email(db, email=user.email)
+    # The handler is async to await the hashing pool, so the blocking
+    # database calls go to the threadpool instead of the event loop
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await password_hasher.hash_async(user.password)
+    try:
+        return await run_in_threadpool(
+            crud.create_user, db=db, user=user, hashed_password=hashed_password
+        )
+    except IntegrityError as e:
+        # Another signup with the same email won the race during the hash
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail="Email already registered") from e
+
+
+@app.post("/users/login", response_model=User)
+async def login_user(login: UserLogin, db: Session = Depends(get_db)):
+    """
+    Check the credentials of a user.
+
+    Passwords hashed with older cost parameters are hashed again.
+    :param login: The email address and password of the user.
+    :param db: The database session.
+    :return: The user with the given credentials.
+    """
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=login.email)
+    if db_user is None:
+        # Take as long as a real check so unknown emails are not revealed
+        await password_hasher.verify_async(login.password, password_hasher.dummy_hash)
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if not await password_hasher.verify_async(login.password, db_user.password):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if password_hasher.needs_rehash(db_user.password):
+        try:
+            hashed_password = await password_hasher.hash_async(login.password)
+        except PasswordHasherBusy:
+            # Upgrading the hash can wait for a later login
+            return db_user
+        db_user = await run_in_threadpool(
+            crud.update_user_password, db, db_user, hashed_password
+        )
+    return db_user
 
 
 @app.get("/users/{user_id}", response_model=User)
@@ -142,15 +263,23 @@ async def create_pin(
     if db_board is None:
         raise HTTPException(status_code=404, detail="Board not found")
 
-    filename, temp_file_path, temp_thumbnail_file_path = await get_file_name(file)
+    try:
+        filename, temp_file_path, temp_thumbnail_file_path, image_hash = (
+            await get_file_name(file)
+        )
+    except validation.ImageValidationError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e)) from e
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
     thumbnail_filename = "thumbnail_" + filename
 
-    image_url = upload_to_s3(temp_file_path, S3_BUCKET, filename)
-    thumbnail_image_url = upload_to_s3(
-        temp_thumbnail_file_path, S3_BUCKET, thumbnail_filename
-    )
-
-    os.remove(temp_file_path)
+    try:
+        image_url = upload_to_s3(temp_file_path, S3_BUCKET, filename)
+        thumbnail_image_url = upload_to_s3(
+            temp_thumbnail_file_path, S3_BUCKET, thumbnail_filename
+        )
+    finally:
+        remove_files(temp_file_path, temp_thumbnail_file_path)
 
     pin = Pin(
         title=title,
@@ -160,30 +289,56 @@ async def create_pin(
         is_private=is_private,
         image_url=image_url,
         thumbnail_url=thumbnail_image_url,
+        image_hash=to_signed(image_hash),
     )
     return crud.create_pin(db=db, pin=pin)
 
 
 async def get_file_name(file):
     """
-    Get the file name.
-    :param file: The file to get the name of.
-    :return: The name of the file.
+    Validate the uploaded image, save it and create its thumbnail.
+    :param file: The image file to save.
+    :return: The name of the file, the paths of the image and thumbnail,
+        and the perceptual hash of the image.
+    :raises ImageValidationError: If the upload breaks a configured limit
+        or cannot be decoded.
     """
-    # Generate a random filename
-    filename = str(uuid.uuid4())
-    file_extension = file.filename.split(".")[-1]  # Get the file extension
-    filename = (
-        f"{filename}.{file_extension}"  # Append the file extension to the filename
-    )
+    # Starlette has already spooled the multipart body, but bad uploads are
+    # rejected from the header before they are copied again or decoded
+    info = await validation.validate_image_upload(file)
+
+    # Generate a random filename, using the extension of the sniffed format
+    filename = f"{uuid.uuid4()}.{info.extension}"
     # Save the file to a temporary location
     temp_file_path = f"/tmp/{filename}"
-    async with aiofiles.open(temp_file_path, "wb") as buffer:
-        data = await file.read()  # async read
-        await buffer.write(data)
-
-    # Open the image file
-    with Image.open(temp_file_path) as img:
+    thumbnail_file_path = f"/tmp/thumbnail_{filename}"
+    try:
+        await validation.save_upload(file, temp_file_path)
+        try:
+            image_hash = make_thumbnail(
+                temp_file_path, thumbnail_file_path, info.format
+            )
+        except (OSError, SyntaxError) as e:
+            # Truncated or corrupt image data behind a valid header
+            raise validation.ImageValidationError(
+                f"Image could not be decoded: {e}"
+            ) from e
+    except BaseException:
+        remove_files(temp_file_path, thumbnail_file_path)
+        raise
+    return filename, temp_file_path, thumbnail_file_path, image_hash
+
+
+def make_thumbnail(image_path: str, thumbnail_path: str, image_format: str):
+    """
+    Create the thumbnail of an image and hash it.
+    :param image_path: The path of the image.
+    :param thumbnail_path: The path to save the thumbnail to.
+    :param image_format: The format sniffed from the image header.
+    :return: The perceptual hash of the image.
+    """
+    # Open the image file, only allowing the decoder for the sniffed format
+    with Image.open(image_path, formats=[image_format]) as img:
         # Correct the orientation using the EXIF data
         img = ImageOps.exif_transpose(img)
 
@@ -192,10 +347,24 @@ async def get_file_name(file):
         hsize = int(300 / ratio)
         img.thumbnail((300, hsize), Resampling.LANCZOS)
 
+        # Hash the thumbnail, which is much cheaper than the full image
+        image_hash = dhash(img)
+
         # Save the resized image as thumbnail
-        thumbnail_file_path = f"/tmp/thumbnail_{filename}"
-        img.save(thumbnail_file_path)
-    return filename, temp_file_path, thumbnail_file_path
+        img.save(thumbnail_path)
+    return image_hash
+
+
+def remove_files(*paths: str):
+    """
+    Remove temporary files, ignoring the ones that do not exist.
+    :param paths: The paths of the files.
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
 
 
 @app.get("/pins")
@@ -232,6 +401,52 @@ async def get_pin_by_id(pin_id: int, db: Session = Depends(get_db)):
     return pin
 
 
+@app.get("/pins/{pin_id}/similar")
+async def get_similar_pins(
+    pin_id: int, number: int = 10, db: Session = Depends(get_db)
+):
+    """
+    Get public pins whose images look like the image of a pin.
+    :param pin_id: The ID of the pin.
+    :param number: number of pins.
+    :param db: The database session.
+    :return: A list of similar pins, most similar first.
+    """
+    if not 1 <= number <= constants.SIMILAR_PINS_MAX_NUMBER:
+        raise HTTPException(
+            status_code=400,
+            detail=f"number must be between 1 and {constants.SIMILAR_PINS_MAX_NUMBER}",
+        )
+    pin = crud.get_pin(db, pin_id=pin_id)
+    if pin is None:
+        raise HTTPException(status_code=404, detail="Pin not found")
+    if pin.image_hash is None:
+        return []
+
+    # Syncing and searching can take a few ms at millions of pins
+    await run_in_threadpool(sync_index, similarity_index, db)
+    if similarity_index.merge_due():
+        # Rebuilding the tables takes a while at millions of pins, the
+        # pending pins are scanned linearly until the new tables are in
+        asyncio.get_running_loop().run_in_executor(None, similarity_index.merge)
+    matches = await run_in_threadpool(
+        similarity_index.search,
+        to_unsigned(pin.image_hash),
+        number=number,
+        max_distance=constants.SIMILAR_PINS_MAX_DISTANCE,
+        exclude=pin_id,
+    )
+    pins = crud.get_pins_by_ids(db, [match_id for match_id, _ in matches])
+    for similar_pin in pins:
+        similar_pin.image_url = generate_presigned_url(
+            S3_BUCKET, similar_pin.image_url.split("/")[-1]
+        )
+        similar_pin.thumbnail_url = generate_presigned_url(
+            S3_BUCKET, similar_pin.thumbnail_url.split("/")[-1]
+        )
+    return pins
+
+
 @app.get("/pins/board/{board_id}")
 async def get_pins_by_board(board_id: int, db: Session = Depends(get_db)):
     """
@@ -22,6 +22,7 @@ class Pin(BaseModel):
         board_id (int): The identifier of the board the pin belongs to.
         owner_id (int): The identifier of the user who owns the pin.
         is_private (bool): Whether the pin is private or not.
+        image_hash (int): The perceptual hash of the pin's image.
     """
 
     id: Union[int, None] = None
@@ -32,3 +33,4 @@ class Pin(BaseModel):
     board_id: int
     owner_id: int
     is_private: bool
+    image_hash: Union[int, None] = None
@@ -0,0 +1,18 @@
+"""
+Pydantic model for logging in a user
+"""
+
+from pydantic import BaseModel
+
+
+class UserLogin(BaseModel):
+    """
+    Represents a login request in the application.
+
+    Attributes:
+        email (str): The email address of the user.
+        password (str): The password of the user.
+    """
+
+    email: str
+    password: str
@@ -0,0 +1,104 @@
+"""
+This module records where the time of a profiled request goes.
+
+The profile of the current request is kept in a context variable, so
+SQL statements and calls into the object store can add their timings
+to it from anywhere, including the threadpool. When no request is being
+profiled the hooks only do a context variable lookup.
+"""
+
+import functools
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Statements past this count are timed in the totals but not listed
+MAX_SQL_STATEMENTS = 500
+
+current_profile = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Represents the timings collected while a request is profiled.
+
+    Attributes:
+        sql (list): The statement and duration in ms of each SQL statement.
+        sql_total_ms (float): The total time spent in SQL statements.
+        sql_count (int): The number of SQL statements.
+        calls (dict): The count and total ms of each timed call, by name.
+    """
+
+    def __init__(self):
+        self.sql = []
+        self.sql_total_ms = 0.0
+        self.sql_count = 0
+        self.calls = {}
+
+    def add_sql(self, statement: str, duration_ms: float):
+        """
+        Record a SQL statement.
+        :param statement: The SQL statement, without its parameters.
+        :param duration_ms: The time the statement took.
+        """
+        self.sql_count += 1
+        self.sql_total_ms += duration_ms
+        if len(self.sql) < MAX_SQL_STATEMENTS:
+            self.sql.append({"statement": statement, "duration_ms": duration_ms})
+
+    def add_call(self, name: str, duration_ms: float):
+        """
+        Record a timed call.
+        :param name: The name of the call.
+        :param duration_ms: The time the call took.
+        """
+        call = self.calls.setdefault(name, {"count": 0, "total_ms": 0.0})
+        call["count"] += 1
+        call["total_ms"] += duration_ms
+
+
+def timed(func):
+    """
+    Decorator adding the time spent in a function to the current profile.
+    :param func: The function to time.
+    :return: The wrapped function.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.add_call(func.__name__, (time.perf_counter() - start) * 1000)
+
+    return wrapper
+
+
+def install_sql_hooks(engine):
+    """
+    Time the SQL statements run on an engine while a request is profiled.
+    :param engine: The SQLAlchemy engine.
+    """
+
+    # The start time lives on the execution context, which is dropped with
+    # the statement, so statements that raise leave nothing behind on the
+    # pooled connection
+    # pylint: disable=R0913,W0613
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if context is not None and current_profile.get() is not None:
+            context.profile_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        start = getattr(context, "profile_query_start", None)
+        if profile is not None and start is not None:
+            profile.add_sql(statement, (time.perf_counter() - start) * 1000)
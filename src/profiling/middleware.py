@@ -0,0 +1,189 @@
+"""
+This module defines the request profiling middleware.
+
+A request is profiled when it carries the profile token header, or when
+it is picked by the sampling rate. Profiled requests run under cProfile
+and collect their SQL and object store timings. Requests profiled on
+demand are always saved, sampled ones only when they are slow.
+
+cProfile follows the event loop thread, so the profile also shows other
+requests interleaved on the loop, but not sync code in the threadpool.
+The SQL and object store timings only belong to the profiled request.
+Only one request per process runs under cProfile at a time.
+
+It is a plain ASGI middleware, so requests that are not profiled are
+passed straight to the application without being wrapped.
+"""
+
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import threading
+import time
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from src import constants
+from src.profiling.context import RequestProfile, current_profile
+from src.profiling.store import profile_store
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+STATS_LINES = 40
+
+# Reading profiles should not push the profiles being read out of the ring
+EXCLUDED_PATH_PREFIX = "/admin/profiles"
+
+_PROFILER_LOCK = threading.Lock()
+
+
+def has_profile_token(token) -> bool:
+    """
+    Check a profile token against the configured one.
+    :param token: The token sent by the client.
+    :return: True if profiling is enabled and the token matches.
+    """
+    if not constants.PROFILE_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), constants.PROFILE_TOKEN.encode())
+
+
+def require_profile_token(request: Request):
+    """
+    Dependency only allowing requests that carry the profile token.
+    :param request: The incoming request.
+    """
+    if not has_profile_token(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+def _start_profiler():
+    # Released in _stop_profiler, once the request is done
+    if not _PROFILER_LOCK.acquire(blocking=False):  # pylint: disable=R1732
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool is active
+        _PROFILER_LOCK.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if profiler is not None:
+        profiler.disable()
+        _PROFILER_LOCK.release()
+
+
+def _format_stats(profiler) -> str:
+    if profiler is None:
+        return "not captured: another request was being profiled"
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(STATS_LINES)
+    return stream.getvalue()
+
+
+def _save(request, status_code, started_at, duration_ms, profile, profiler):
+    """
+    Build the profile record and save it to the store.
+    :return: The ID of the saved profile.
+    """
+    # pylint: disable=R0913
+    return profile_store.save(
+        {
+            "started_at": started_at,
+            "method": request.method,
+            "path": request.url.path,
+            "query": request.url.query,
+            "status_code": status_code,
+            "duration_ms": duration_ms,
+            "sql_count": profile.sql_count,
+            "sql_total_ms": profile.sql_total_ms,
+            "sql": profile.sql,
+            "calls": profile.calls,
+            "cprofile": _format_stats(profiler),
+        }
+    )
+
+
+def _should_profile(scope) -> tuple:
+    """
+    Decide whether a request is profiled.
+    :param scope: The ASGI scope of the request.
+    :return: Whether to profile it, and whether it carried the profile token.
+    """
+    if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PATH_PREFIX):
+        return False, False
+    requested = bool(constants.PROFILE_TOKEN) and has_profile_token(
+        Headers(scope=scope).get(PROFILE_HEADER)
+    )
+    if requested:
+        return True, True
+    return random.random() < constants.PROFILE_SAMPLE_RATE, False
+
+
+class ProfileRequests:  # pylint: disable=R0903
+    """
+    Profiles the requests that opted in or were sampled.
+
+    The profile covers the request until its response headers are sent,
+    so the profile ID can be returned in a header.
+
+    Attributes:
+        app: The wrapped ASGI application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiled, requested = _should_profile(scope)
+        if not profiled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        context_token = current_profile.set(profile)
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler = _start_profiler()
+        finished = False
+
+        async def finish(status_code):
+            nonlocal finished
+            finished = True
+            _stop_profiler(profiler)
+            duration_ms = (time.perf_counter() - start) * 1000
+            if not requested and duration_ms < constants.PROFILE_SLOW_MS:
+                return None
+            return await run_in_threadpool(
+                _save,
+                Request(scope),
+                status_code,
+                started_at,
+                duration_ms,
+                profile,
+                profiler,
+            )
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile_id = await finish(message["status"])
+                if profile_id is not None:
+                    MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if not finished:
+                # The application failed before sending a response
+                await finish(500)
+            current_profile.reset(context_token)
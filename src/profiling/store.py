@@ -0,0 +1,105 @@
+"""
+This module keeps captured request profiles in a bounded on-disk ring.
+
+Each profile is a JSON file named after its ID. IDs start with the
+capture time in milliseconds, so the oldest files are removed first once
+the ring is full.
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+
+from src import constants
+
+_PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+SUMMARY_FIELDS = (
+    "id",
+    "started_at",
+    "method",
+    "path",
+    "status_code",
+    "duration_ms",
+    "sql_count",
+    "sql_total_ms",
+)
+
+
+class ProfileStore:
+    """
+    Represents the ring buffer of saved profiles.
+
+    Attributes:
+        directory (str): The directory holding the profile files.
+        max_entries (int): The number of profiles to keep.
+    """
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def _ids(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        names = (name[: -len(".json")] for name in os.listdir(self.directory))
+        return sorted(
+            (name for name in names if _PROFILE_ID.match(name)),
+            key=lambda name: int(name.split("-")[0]),
+        )
+
+    def save(self, profile: dict) -> str:
+        """
+        Save a profile, dropping the oldest ones past max_entries.
+        :param profile: The profile to save.
+        :return: The ID of the saved profile.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.time_ns() // 1_000_000}-{uuid.uuid4().hex[:8]}"
+        path = self._path(profile_id)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fp:
+            json.dump({"id": profile_id, **profile}, fp)
+        os.replace(f"{path}.tmp", path)
+
+        for old_id in self._ids()[: -self.max_entries]:
+            try:
+                os.remove(self._path(old_id))
+            except FileNotFoundError:
+                pass
+        return profile_id
+
+    def get(self, profile_id: str):
+        """
+        Get a saved profile.
+        :param profile_id: The ID of the profile.
+        :return: The profile, or None if it does not exist.
+        """
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id), encoding="utf-8") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def summaries(self) -> list:
+        """
+        Get a summary of every saved profile.
+        :return: A list of profile summaries, newest first.
+        """
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            profile = self.get(profile_id)
+            if profile is not None:
+                summaries.append(
+                    {field: profile.get(field) for field in SUMMARY_FIELDS}
+                )
+        return summaries
+
+
+profile_store = ProfileStore(constants.PROFILE_DIR, constants.PROFILE_MAX_ENTRIES)